@@ -20,6 +20,9 @@
 # s: "i hate that."
 
 
+from functools import partial
+from typing import Any, NamedTuple
+
 __version__ = (0, 0, 15)
 
 
@@ -50,9 +53,15 @@ def intersect(ra, rb):
 
 
 def compare_range(a, astart, aend, b, bstart, bend):
-    """Compare a[astart:aend] == b[bstart:bend], without slicing."""
+    """Compare a[astart:aend] == b[bstart:bend]."""
     if (aend - astart) != (bend - bstart):
         return False
+    if type(a) is type(b) and isinstance(a, (list, tuple, bytes, str)):
+        # Let the sequence type compare the slices in C.
+        return a[astart:aend] == b[bstart:bend]
+    # Other sequence types may not support slicing, and slices of different
+    # types (e.g. list and tuple) never compare equal, so fall back to
+    # comparing element by element.
     for ia, ib in zip(range(astart, aend), range(bstart, bend)):
         if a[ia] != b[ib]:
             return False
@@ -60,16 +69,222 @@ def compare_range(a, astart, aend, b, bstart, bend):
         return True
 
 
+def _intern(seq, table):
+    """Return a tuple with the id of every item of seq.
+
+    New items are added to table and given the next free id.
+    """
+    return tuple([table.setdefault(item, len(table)) for item in seq])
+
+
+def _sync_regions(amatches, bmatches, base_len, a_len, b_len):
+    """Combine the matching blocks of base against a and b into sync regions.
+
+    This is the core of Merge3.find_sync_regions. It only deals with
+    integers and plain local variables.
+    """
+    ia = ib = 0
+    len_a = len(amatches)
+    len_b = len(bmatches)
+
+    sl = []
+
+    while ia < len_a and ib < len_b:
+        abase, amatch, alen = amatches[ia]
+        bbase, bmatch, blen = bmatches[ib]
+
+        # there is an unconflicted block at i; how long does it
+        # extend?  until whichever one ends earlier.
+        # (this is intersect(), inlined as it is called for every block)
+        alimit = abase + alen
+        blimit = bbase + blen
+        intbase = abase if abase > bbase else bbase
+        intend = alimit if alimit < blimit else blimit
+        if intbase < intend:
+            intlen = intend - intbase
+
+            # found a match of base[intbase:intend]; this may be less than
+            # the region that matches in either one
+            # assert intlen <= alen
+            # assert intlen <= blen
+            # assert abase <= intbase
+            # assert bbase <= intbase
+
+            asub = amatch + (intbase - abase)
+            bsub = bmatch + (intbase - bbase)
+            aend = asub + intlen
+            bend = bsub + intlen
+
+            # assert base[intbase:intend] == a[asub:aend], \
+            #       (base[intbase:intend], a[asub:aend])
+            # assert base[intbase:intend] == b[bsub:bend]
+
+            sl.append((intbase, intend, asub, aend, bsub, bend))
+        # advance whichever one ends first in the base text
+        if alimit < blimit:
+            ia += 1
+        else:
+            ib += 1
+
+    sl.append((base_len, base_len, a_len, a_len, b_len, b_len))
+
+    return sl
+
+
+class _Constants(NamedTuple):
+    """Markers and separators used when formatting a merge."""
+
+    space: Any
+    start_marker: Any
+    mid_marker: Any
+    end_marker: Any
+    crlf: Any
+    cr: Any
+    lf: Any
+    # used by merge_annotated
+    unchanged_prefix: Any
+    a_prefix: Any
+    b_prefix: Any
+    a_conflict_prefix: Any
+    b_conflict_prefix: Any
+    conflict_start: Any
+    conflict_mid: Any
+    conflict_end: Any
+
+
+# The constants are selected once per Merge3, depending on whether it is
+# merging text or bytes.
+_TEXT_CONSTANTS = _Constants(
+    space=" ",
+    start_marker="<<<<<<<",
+    mid_marker="=======",
+    end_marker=">>>>>>>",
+    crlf="\r\n",
+    cr="\r",
+    lf="\n",
+    unchanged_prefix="u | ",
+    a_prefix="a | ",
+    b_prefix="b | ",
+    a_conflict_prefix="A | ",
+    b_conflict_prefix="B | ",
+    conflict_start="<<<<\n",
+    conflict_mid="----\n",
+    conflict_end=">>>>\n",
+)
+_BYTES_CONSTANTS = _Constants(*(value.encode("ascii") for value in _TEXT_CONSTANTS))
+
+_default_sequence_matcher = None
+
+
+def _get_default_sequence_matcher():
+    """Return the sequence matcher class to use if none is specified.
+
+    This is cdifflib's C implementation of difflib.SequenceMatcher if it is
+    installed, and difflib.SequenceMatcher otherwise.
+    """
+    global _default_sequence_matcher
+    if _default_sequence_matcher is None:
+        try:
+            from cdifflib import CSequenceMatcher
+        except ImportError:
+            import difflib
+
+            _default_sequence_matcher = difflib.SequenceMatcher
+        else:
+            _default_sequence_matcher = CSequenceMatcher
+    return _default_sequence_matcher
+
+
+def _with_autojunk(sequence_matcher, autojunk):
+    """Return sequence_matcher, passing autojunk on if it takes it.
+
+    Custom matchers don't necessarily support autojunk, so it is only passed
+    to those with an explicit autojunk parameter that the caller has not
+    already bound with functools.partial().
+    """
+    import inspect
+
+    if isinstance(sequence_matcher, partial):
+        if "autojunk" in sequence_matcher.keywords:
+            return sequence_matcher
+    try:
+        parameters = inspect.signature(sequence_matcher).parameters
+    except (TypeError, ValueError):
+        # Some builtins have no introspectable signature.
+        return sequence_matcher
+    parameter = parameters.get("autojunk")
+    if parameter is None or parameter.kind is parameter.POSITIONAL_ONLY:
+        return sequence_matcher
+    return partial(sequence_matcher, autojunk=autojunk)
+
+
+def set_default_sequence_matcher(sequence_matcher) -> None:
+    """Set the sequence matcher to use for Merge3 objects that don't specify one.
+
+    :param sequence_matcher: a class like difflib.SequenceMatcher, or None
+        to go back to picking the best available implementation
+    """
+    global _default_sequence_matcher
+    _default_sequence_matcher = sequence_matcher
+
+
+class RapidFuzzSequenceMatcher:
+    """Sequence matcher that uses the Indel distance from rapidfuzz.
+
+    This computes a longest common subsequence in C++, which is usually a
+    lot faster than difflib.SequenceMatcher on large inputs, but it may
+    align ambiguous regions differently.
+
+    Items are compared by hash, so the sequences should consist of items
+    whose hashes do not collide (Merge3 passes it integer line ids).
+    Requires the rapidfuzz package.
+    """
+
+    def __init__(self, isjunk=None, a=(), b=()) -> None:
+        """Constructor.
+
+        :param isjunk: must be None, junk filtering is not supported
+        :param a: first sequence to compare
+        :param b: second sequence to compare
+        """
+        from rapidfuzz.distance import Indel
+
+        if isjunk is not None:
+            raise ValueError("isjunk is not supported")
+        self._indel = Indel
+        self.a = a
+        self.b = b
+
+    def get_matching_blocks(self):
+        """Return list of triples describing matching subsequences."""
+        opcodes = self._indel.opcodes(self.a, self.b)
+        return [(m.a, m.b, m.size) for m in opcodes.as_matching_blocks()]
+
+
 class Merge3:
     """3-way merge of texts.
 
     Given BASE, OTHER, THIS, tries to produce a combined text
     incorporating the changes from both BASE->OTHER and BASE->THIS.
     All three will typically be sequences of lines.
+
+    The sync regions and merge regions are computed once and cached, so
+    the inputs must not be modified or reassigned after construction.
+
+    Lines are diffed as integer ids, with equal lines getting equal ids, so
+    the sequence matcher is called with tuples of ints rather than with the
+    lines themselves. Matchers that look at line content (for example to
+    ignore whitespace) will not work.
     """
 
     def __init__(
-        self, base, a, b, is_cherrypick: bool = False, sequence_matcher=None
+        self,
+        base,
+        a,
+        b,
+        is_cherrypick: bool = False,
+        sequence_matcher=None,
+        autojunk: bool = False,
     ) -> None:
         """Constructor.
 
@@ -78,18 +293,46 @@ class Merge3:
         :param b: lines in B
         :param is_cherrypick: flag indicating if this merge is a cherrypick.
             When cherrypicking b => a, matches with b and base do not conflict.
-        :param sequence_matcher: Sequence matcher to use (defaults to
-            difflib.SequenceMatcher)
+        :param sequence_matcher: Sequence matcher to use (defaults to the
+            one set with set_default_sequence_matcher(), or to
+            cdifflib.CSequenceMatcher if available, or
+            difflib.SequenceMatcher otherwise). It is given tuples of
+            integer line ids, not the lines.
+        :param autojunk: whether to enable the "popular lines" heuristic of
+            the sequence matcher. Only passed on to matchers that have an
+            autojunk parameter, such as difflib.SequenceMatcher, and not to
+            functools.partial() objects that already set it.
         """
         if sequence_matcher is None:
-            import difflib
-
-            sequence_matcher = difflib.SequenceMatcher
+            sequence_matcher = _get_default_sequence_matcher()
         self.base = base
         self.a = a
         self.b = b
         self.is_cherrypick = is_cherrypick
         self.sequence_matcher = sequence_matcher
+        self._sequence_matcher = _with_autojunk(sequence_matcher, autojunk)
+        # Pick the str or bytes constants once, so that the output methods
+        # don't need to dispatch on the input type.
+        if self._uses_bytes():
+            self._constants = c = _BYTES_CONSTANTS
+        else:
+            self._constants = c = _TEXT_CONSTANTS
+        # Use the line ending of the first line in a, if there is one.
+        first_line = self.a[0] if len(self.a) > 0 else None
+        tail = first_line[-2:] if isinstance(first_line, (bytes, str)) else c.lf
+        if tail == c.crlf:
+            self._newline = c.crlf
+        elif tail[-1:] == c.cr:
+            self._newline = c.cr
+        else:
+            self._newline = c.lf
+        # The inputs are treated as immutable; these caches are filled in
+        # lazily and reused by the various merge_* methods.
+        self._ids = None
+        self._matches = None
+        self._sync_regions = None
+        self._unconflicted = None
+        self._merge_regions = None
 
     def _uses_bytes(self):
         if len(self.a) > 0:
@@ -101,6 +344,49 @@ class Merge3:
         else:
             return False
 
+    def _matching_blocks(self):
+        """Return the matching blocks of base against a and b.
+
+        The results are computed once and shared between find_sync_regions
+        and find_unconflicted.
+        """
+        if self._matches is None:
+            base_ids, a_ids, b_ids = self._line_ids()
+            amatches = self._get_matching_blocks(base_ids, a_ids)
+            bmatches = self._get_matching_blocks(base_ids, b_ids)
+            self._matches = (amatches, bmatches)
+        return self._matches
+
+    def _line_ids(self):
+        """Return base, a and b with every line replaced by an integer id.
+
+        Equal lines get equal ids, so matching blocks and range comparisons
+        are the same as for the lines themselves, but hashing and comparing
+        the ids is cheaper than doing so for (possibly long) lines.
+        """
+        if self._ids is None:
+            table = {}
+            self._ids = (
+                _intern(self.base, table),
+                _intern(self.a, table),
+                _intern(self.b, table),
+            )
+        return self._ids
+
+    def _get_matching_blocks(self, x, y):
+        """Return the matching blocks between x and y.
+
+        Identical or empty sequences are handled without invoking the
+        sequence matcher.
+        """
+        if x is y or x == y:
+            n = len(x)
+            return ([(0, 0, n)] if n else []) + [(n, n, 0)]
+        if not x or not y:
+            return [(len(x), len(y), 0)]
+        # cdifflib returns an iterator rather than a list.
+        return list(self._sequence_matcher(None, x, y).get_matching_blocks())
+
     def merge_lines(
         self,
         name_a=None,
@@ -115,72 +401,47 @@ class Merge3:
         """Return merge in cvs-like form."""
         if base_marker and reprocess:
             raise CantReprocessAndShowBase()
-        if self._uses_bytes():
-            if len(self.a) > 0:
-                if self.a[0].endswith(b"\r\n"):
-                    newline = b"\r\n"
-                elif self.a[0].endswith(b"\r"):
-                    newline = b"\r"
-                else:
-                    newline = b"\n"
-            else:
-                newline = b"\n"
-            if start_marker is None:
-                start_marker = b"<<<<<<<"
-            if mid_marker is None:
-                mid_marker = b"======="
-            if end_marker is None:
-                end_marker = b">>>>>>>"
-            space = b" "
-        else:
-            if start_marker is None:
-                start_marker = "<<<<<<<"
-            if mid_marker is None:
-                mid_marker = "======="
-            if end_marker is None:
-                end_marker = ">>>>>>>"
-            if len(self.a) > 0:
-                if self.a[0].endswith("\r\n"):
-                    newline = "\r\n"
-                elif self.a[0].endswith("\r"):
-                    newline = "\r"
-                else:
-                    newline = "\n"
-            else:
-                newline = "\n"
-            space = " "
+        constants = self._constants
+        newline = self._newline
+        space = constants.space
+        if start_marker is None:
+            start_marker = constants.start_marker
+        if mid_marker is None:
+            mid_marker = constants.mid_marker
+        if end_marker is None:
+            end_marker = constants.end_marker
         if name_a:
             start_marker = start_marker + space + name_a
         if name_b:
             end_marker = end_marker + space + name_b
         if name_base and base_marker:
             base_marker = base_marker + space + name_base
+        start_line = start_marker + newline
+        mid_line = mid_marker + newline
+        end_line = end_marker + newline
+        if base_marker is not None:
+            base_line = base_marker + newline
+        base, a, b = self.base, self.a, self.b
         merge_regions = self.merge_regions()
         if reprocess is True:
             merge_regions = self.reprocess_merge_regions(merge_regions)
         for t in merge_regions:
             what = t[0]
             if what == "unchanged":
-                for i in range(t[1], t[2]):
-                    yield self.base[i]
+                yield from base[t[1] : t[2]]
             elif what == "a" or what == "same":
-                for i in range(t[1], t[2]):
-                    yield self.a[i]
+                yield from a[t[1] : t[2]]
             elif what == "b":
-                for i in range(t[1], t[2]):
-                    yield self.b[i]
+                yield from b[t[1] : t[2]]
             elif what == "conflict":
-                yield start_marker + newline
-                for i in range(t[3], t[4]):
-                    yield self.a[i]
+                yield start_line
+                yield from a[t[3] : t[4]]
                 if base_marker is not None:
-                    yield base_marker + newline
-                    for i in range(t[1], t[2]):
-                        yield self.base[i]
-                yield mid_marker + newline
-                for i in range(t[5], t[6]):
-                    yield self.b[i]
-                yield end_marker + newline
+                    yield base_line
+                    yield from base[t[1] : t[2]]
+                yield mid_line
+                yield from b[t[5] : t[6]]
+                yield end_line
             else:
                 raise ValueError(what)
 
@@ -189,42 +450,33 @@ class Merge3:
 
         Most useful for debugging merge.
         """
-        if self._uses_bytes():
-            UNCHANGED = b"u"
-            SEP = b" | "
-            CONFLICT_START = b"<<<<\n"
-            CONFLICT_MID = b"----\n"
-            CONFLICT_END = b">>>>\n"
-            WIN_A = b"a"
-            WIN_B = b"b"
-        else:
-            UNCHANGED = "u"
-            SEP = " | "
-            CONFLICT_START = "<<<<\n"
-            CONFLICT_MID = "----\n"
-            CONFLICT_END = ">>>>\n"
-            WIN_A = "a"
-            WIN_B = "b"
+        c = self._constants
+        base, a, b = self.base, self.a, self.b
+        unchanged_prefix = c.unchanged_prefix
+        a_prefix = c.a_prefix
+        b_prefix = c.b_prefix
+        a_conflict_prefix = c.a_conflict_prefix
+        b_conflict_prefix = c.b_conflict_prefix
 
         for t in self.merge_regions():
             what = t[0]
             if what == "unchanged":
-                for i in range(t[1], t[2]):
-                    yield UNCHANGED + SEP + self.base[i]
+                for line in base[t[1] : t[2]]:
+                    yield unchanged_prefix + line
             elif what == "a" or what == "same":
-                for i in range(t[1], t[2]):
-                    yield WIN_A.lower() + SEP + self.a[i]
+                for line in a[t[1] : t[2]]:
+                    yield a_prefix + line
             elif what == "b":
-                for i in range(t[1], t[2]):
-                    yield WIN_B.lower() + SEP + self.b[i]
+                for line in b[t[1] : t[2]]:
+                    yield b_prefix + line
             elif what == "conflict":
-                yield CONFLICT_START
-                for i in range(t[3], t[4]):
-                    yield WIN_A.upper() + SEP + self.a[i]
-                yield CONFLICT_MID
-                for i in range(t[5], t[6]):
-                    yield WIN_B.upper() + SEP + self.b[i]
-                yield CONFLICT_END
+                yield c.conflict_start
+                for line in a[t[3] : t[4]]:
+                    yield a_conflict_prefix + line
+                yield c.conflict_mid
+                for line in b[t[5] : t[6]]:
+                    yield b_conflict_prefix + line
+                yield c.conflict_end
             else:
                 raise ValueError(what)
 
@@ -246,20 +498,21 @@ class Merge3:
         'conflict', base_lines, a_lines, b_lines
              Lines from base were changed to either a or b and conflict.
         """
+        base, a, b = self.base, self.a, self.b
         for t in self.merge_regions():
             what = t[0]
             if what == "unchanged":
-                yield what, self.base[t[1] : t[2]]
+                yield what, base[t[1] : t[2]]
             elif what == "a" or what == "same":
-                yield what, self.a[t[1] : t[2]]
+                yield what, a[t[1] : t[2]]
             elif what == "b":
-                yield what, self.b[t[1] : t[2]]
+                yield what, b[t[1] : t[2]]
             elif what == "conflict":
                 yield (
                     what,
-                    self.base[t[1] : t[2]],
-                    self.a[t[3] : t[4]],
-                    self.b[t[5] : t[6]],
+                    base[t[1] : t[2]],
+                    a[t[3] : t[4]],
+                    b[t[5] : t[6]],
                 )
             else:
                 raise ValueError(what)
@@ -290,6 +543,21 @@ class Merge3:
         The regions in between can be in any of three cases:
         conflicted, or changed on only one side.
         """
+        if self._merge_regions is None:
+            self._merge_regions = self._compute_merge_regions()
+        return iter(self._merge_regions)
+
+    def merge_regions_list(self):
+        """Return the regions from merge_regions as a list."""
+        if self._merge_regions is None:
+            self._merge_regions = self._compute_merge_regions()
+        return list(self._merge_regions)
+
+    def _compute_merge_regions(self):
+        """Compute the list of regions returned by merge_regions."""
+        regions = []
+        append = regions.append
+        base_ids, a_ids, b_ids = self._line_ids()
         # section a[0:ia] has been disposed of, etc
         iz = ia = ib = 0
 
@@ -308,25 +576,29 @@ class Merge3:
             # print 'unmatched a=%d, b=%d' % (len_a, len_b)
 
             if len_a or len_b:
-                # try to avoid actually slicing the lists
-                same = compare_range(self.a, ia, amatch, self.b, ib, bmatch)
+                # ranges of different lengths can't be equal, so only slice
+                # (and compare) the ids when the lengths agree
+                len_z = zmatch - iz
+                same = len_a == len_b and a_ids[ia:amatch] == b_ids[ib:bmatch]
 
                 if same:
-                    yield "same", ia, amatch
+                    append(("same", ia, amatch))
                 else:
-                    equal_a = compare_range(self.a, ia, amatch, self.base, iz, zmatch)
-                    equal_b = compare_range(self.b, ib, bmatch, self.base, iz, zmatch)
+                    equal_a = len_a == len_z and a_ids[ia:amatch] == base_ids[iz:zmatch]
+                    equal_b = len_b == len_z and b_ids[ib:bmatch] == base_ids[iz:zmatch]
                     if equal_a and not equal_b:
-                        yield "b", ib, bmatch
+                        append(("b", ib, bmatch))
                     elif equal_b and not equal_a:
-                        yield "a", ia, amatch
+                        append(("a", ia, amatch))
                     elif not equal_a and not equal_b:
                         if self.is_cherrypick:
-                            yield from self._refine_cherrypick_conflict(
-                                iz, zmatch, ia, amatch, ib, bmatch
+                            regions.extend(
+                                self._refine_cherrypick_conflict(
+                                    iz, zmatch, ia, amatch, ib, bmatch
+                                )
                             )
                         else:
-                            yield ("conflict", iz, zmatch, ia, amatch, ib, bmatch)
+                            append(("conflict", iz, zmatch, ia, amatch, ib, bmatch))
                     else:
                         raise AssertionError("can't handle a=b=base but unmatched")
 
@@ -343,76 +615,52 @@ class Merge3:
                 # assert ib == bmatch
                 # assert iz == zmatch
 
-                yield "unchanged", zmatch, zend
+                append(("unchanged", zmatch, zend))
                 iz = zend
                 ia = aend
                 ib = bend
 
+        return regions
+
     def _refine_cherrypick_conflict(self, zstart, zend, astart, aend, bstart, bend):
         """When cherrypicking b => a, ignore matches with b and base."""
+        base_ids, _, b_ids = self._line_ids()
+        if zstart == zend or bstart == bend:
+            # Nothing to refine; the whole region is one conflict.
+            yield ("conflict", zstart, zend, astart, aend, bstart, bend)
+            return
         # Do not emit regions which match, only regions which do not match
-        matcher = self.sequence_matcher(
-            None, self.base[zstart:zend], self.b[bstart:bend]
-        )
-        matches = matcher.get_matching_blocks()
+        matches = self._sequence_matcher(
+            None, base_ids[zstart:zend], b_ids[bstart:bend]
+        ).get_matching_blocks()
+        # (base_start, base_end, b_start, b_end) of every unmatched b range
+        unmatched = []
         last_base_idx = 0
         last_b_idx = 0
-        last_b_idx = 0
-        yielded_a = False
         for base_idx, b_idx, match_len in matches:
-            conflict_b_len = b_idx - last_b_idx
-            if conflict_b_len == 0:
-                pass
-            else:
-                if yielded_a:
-                    yield (
-                        "conflict",
+            if b_idx != last_b_idx:
+                unmatched.append(
+                    (
                         zstart + last_base_idx,
                         zstart + base_idx,
-                        aend,
-                        aend,
-                        bstart + last_b_idx,
-                        bstart + b_idx,
-                    )
-                else:
-                    # The first conflict gets the a-range
-                    yielded_a = True
-                    yield (
-                        "conflict",
-                        zstart + last_base_idx,
-                        zstart + base_idx,
-                        astart,
-                        aend,
                         bstart + last_b_idx,
                         bstart + b_idx,
                     )
+                )
             last_base_idx = base_idx + match_len
             last_b_idx = b_idx + match_len
+        # get_matching_blocks() ends with a (len(base), len(b), 0) sentinel,
+        # so this only triggers for matchers that leave it out.
         if last_base_idx != zend - zstart or last_b_idx != bend - bstart:
-            if yielded_a:
-                yield (
-                    "conflict",
-                    zstart + last_base_idx,
-                    zstart + base_idx,
-                    aend,
-                    aend,
-                    bstart + last_b_idx,
-                    bstart + b_idx,
-                )
-            else:
-                # The first conflict gets the a-range
-                yielded_a = True
-                yield (
-                    "conflict",
-                    zstart + last_base_idx,
-                    zstart + base_idx,
-                    astart,
-                    aend,
-                    bstart + last_b_idx,
-                    bstart + b_idx,
-                )
-        if not yielded_a:
+            unmatched.append((zstart + last_base_idx, zend, bstart + last_b_idx, bend))
+        if not unmatched:
             yield ("conflict", zstart, zend, astart, aend, bstart, bend)
+            return
+        # The first conflict gets the a-range
+        a1 = astart
+        for z1, z2, b1, b2 in unmatched:
+            yield ("conflict", z1, z2, a1, aend, b1, b2)
+            a1 = aend
 
     def reprocess_merge_regions(self, merge_regions):
         """Where there are conflict regions, remove the agreed lines.
@@ -420,30 +668,37 @@ class Merge3:
         Lines where both A and B have made the same changes are
         eliminated.
         """
+        _, a_ids, b_ids = self._line_ids()
         for region in merge_regions:
             if region[0] != "conflict":
                 yield region
                 continue
             type, iz, zmatch, ia, amatch, ib, bmatch = region
-            a_region = self.a[ia:amatch]
-            b_region = self.b[ib:bmatch]
-            matches = self.sequence_matcher(
-                None, a_region, b_region
-            ).get_matching_blocks()
+            a_region = a_ids[ia:amatch]
+            b_region = b_ids[ib:bmatch]
+            if a_region == b_region:
+                if a_region:
+                    yield "same", ia, amatch
+                continue
+            if not a_region or not b_region:
+                # Nothing to match up; the whole region remains a conflict.
+                yield "conflict", None, None, ia, amatch, ib, bmatch
+                continue
+            matches = self._get_matching_blocks(a_region, b_region)
             next_a = ia
             next_b = ib
+            # The mismatch_region() check is inlined, as this loop runs once
+            # per matching block.
             for region_ia, region_ib, region_len in matches[:-1]:
                 region_ia += ia
                 region_ib += ib
-                reg = self.mismatch_region(next_a, region_ia, next_b, region_ib)
-                if reg is not None:
-                    yield reg
+                if next_a < region_ia or next_b < region_ib:
+                    yield "conflict", None, None, next_a, region_ia, next_b, region_ib
                 yield "same", region_ia, region_len + region_ia
                 next_a = region_ia + region_len
                 next_b = region_ib + region_len
-            reg = self.mismatch_region(next_a, amatch, next_b, bmatch)
-            if reg is not None:
-                yield reg
+            if next_a < amatch or next_b < bmatch:
+                yield "conflict", None, None, next_a, amatch, next_b, bmatch
 
     @staticmethod
     def mismatch_region(next_a, region_ia, next_b, region_ib):
@@ -456,77 +711,41 @@ class Merge3:
         Generates a list of (base1, base2, a1, a2, b1, b2).  There is
         always a zero-length sync region at the end of all the files.
         """
-        ia = ib = 0
-        amatches = self.sequence_matcher(None, self.base, self.a).get_matching_blocks()
-        bmatches = self.sequence_matcher(None, self.base, self.b).get_matching_blocks()
-        len_a = len(amatches)
-        len_b = len(bmatches)
-
-        sl = []
-
-        while ia < len_a and ib < len_b:
-            abase, amatch, alen = amatches[ia]
-            bbase, bmatch, blen = bmatches[ib]
-
-            # there is an unconflicted block at i; how long does it
-            # extend?  until whichever one ends earlier.
-            i = intersect((abase, abase + alen), (bbase, bbase + blen))
-            if i:
-                intbase = i[0]
-                intend = i[1]
-                intlen = intend - intbase
-
-                # found a match of base[i[0], i[1]]; this may be less than
-                # the region that matches in either one
-                # assert intlen <= alen
-                # assert intlen <= blen
-                # assert abase <= intbase
-                # assert bbase <= intbase
-
-                asub = amatch + (intbase - abase)
-                bsub = bmatch + (intbase - bbase)
-                aend = asub + intlen
-                bend = bsub + intlen
-
-                # assert self.base[intbase:intend] == self.a[asub:aend], \
-                #       (self.base[intbase:intend], self.a[asub:aend])
-                # assert self.base[intbase:intend] == self.b[bsub:bend]
-
-                sl.append((intbase, intend, asub, aend, bsub, bend))
-            # advance whichever one ends first in the base text
-            if (abase + alen) < (bbase + blen):
-                ia += 1
-            else:
-                ib += 1
-
-        intbase = len(self.base)
-        abase = len(self.a)
-        bbase = len(self.b)
-        sl.append((intbase, intbase, abase, abase, bbase, bbase))
-
-        return sl
+        if self._sync_regions is None:
+            amatches, bmatches = self._matching_blocks()
+            self._sync_regions = _sync_regions(
+                amatches, bmatches, len(self.base), len(self.a), len(self.b)
+            )
+        return list(self._sync_regions)
 
     def find_unconflicted(self):
         """Return a list of ranges in base that are not conflicted."""
-        am = self.sequence_matcher(None, self.base, self.a).get_matching_blocks()
-        bm = self.sequence_matcher(None, self.base, self.b).get_matching_blocks()
+        if self._unconflicted is not None:
+            return list(self._unconflicted)
+        am, bm = self._matching_blocks()
+        ia = ib = 0
+        len_a = len(am)
+        len_b = len(bm)
 
         unc = []
 
-        while am and bm:
+        while ia < len_a and ib < len_b:
             # there is an unconflicted block at i; how long does it
             # extend?  until whichever one ends earlier.
-            a1 = am[0][0]
-            a2 = a1 + am[0][2]
-            b1 = bm[0][0]
-            b2 = b1 + bm[0][2]
-            i = intersect((a1, a2), (b1, b2))
-            if i:
-                unc.append(i)
+            a1, _, alen = am[ia]
+            a2 = a1 + alen
+            b1, _, blen = bm[ib]
+            b2 = b1 + blen
+            # inlined intersect((a1, a2), (b1, b2))
+            i1 = a1 if a1 > b1 else b1
+            i2 = a2 if a2 < b2 else b2
+            if i1 < i2:
+                unc.append((i1, i2))
 
             if a2 < b2:
-                del am[0]
+                ia += 1
             else:
-                del bm[0]
+                ib += 1
 
-        return unc
+        self._unconflicted = unc
+        return list(unc)
@@ -14,12 +14,13 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import argparse
+import sys
+
 from . import Merge3
 
 
 def main(argv=None):
-    import argparse
-
     parser = argparse.ArgumentParser()
     # as for diff3 and meld the syntax is "MINE BASE OTHER"
     parser.add_argument("mine", type=argparse.FileType("rt"), help="My text")
@@ -42,6 +43,4 @@ def main(argv=None):
 
 
 if __name__ == "__main__":
-    import sys
-
     sys.exit(main(sys.argv[1:]))
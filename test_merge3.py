@@ -15,23 +15,23 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
-import struct
+import difflib
+import functools
 import unittest
-from io import StringIO
 
 import merge3
 
-int2byte = struct.Struct(">B").pack
+int2byte = [bytes((i,)) for i in range(256)].__getitem__
 
 
 def split_lines(t):
-    return StringIO(t).readlines()
+    return t.splitlines(True)
 
 
 ############################################################
 # test case data from the gnu diffutils manual
 # common base
-TZU = split_lines("""     The Nameless is the origin of Heaven and Earth;
+TZU_TEXT = """     The Nameless is the origin of Heaven and Earth;
      The named is the mother of all things.
 
      Therefore let there always be non-being,
@@ -44,9 +44,9 @@ TZU = split_lines("""     The Nameless is the origin of Heaven and Earth;
      They both may be called deep and profound.
      Deeper and more profound,
      The door of all subtleties!
-""")
+"""
 
-LAO = split_lines("""     The Way that can be told of is not the eternal Way;
+LAO_TEXT = """     The Way that can be told of is not the eternal Way;
      The name that can be named is not the eternal name.
      The Nameless is the origin of Heaven and Earth;
      The Named is the mother of all things.
@@ -57,10 +57,10 @@ LAO = split_lines("""     The Way that can be told of is not the eternal Way;
      The two are the same,
      But after they are produced,
        they have different names.
-""")
+"""
 
 
-TAO = split_lines("""     The Way that can be told of is not the eternal Way;
+TAO_TEXT = """     The Way that can be told of is not the eternal Way;
      The name that can be named is not the eternal name.
      The Nameless is the origin of Heaven and Earth;
      The named is the mother of all things.
@@ -75,10 +75,9 @@ TAO = split_lines("""     The Way that can be told of is not the eternal Way;
 
        -- The Way of Lao-Tzu, tr. Wing-tsit Chan
 
-""")
+"""
 
-MERGED_RESULT = split_lines(
-    """     The Way that can be told of is not the eternal Way;
+MERGED_RESULT_TEXT = """     The Way that can be told of is not the eternal Way;
      The name that can be named is not the eternal name.
      The Nameless is the origin of Heaven and Earth;
      The Named is the mother of all things.
@@ -96,7 +95,46 @@ MERGED_RESULT = split_lines(
 
 >>>>>>> TAO
 """
-)
+
+TZU = split_lines(TZU_TEXT)
+LAO = split_lines(LAO_TEXT)
+TAO = split_lines(TAO_TEXT)
+MERGED_RESULT = split_lines(MERGED_RESULT_TEXT)
+
+TZU_B = TZU_TEXT.encode().splitlines(True)
+LAO_B = LAO_TEXT.encode().splitlines(True)
+TAO_B = TAO_TEXT.encode().splitlines(True)
+MERGED_RESULT_B = MERGED_RESULT_TEXT.encode().splitlines(True)
+
+# Inputs for the reprocessing tests
+BASE20 = tuple(("a\n" * 20).splitlines(True))
+THIS20 = tuple(("a\n" * 10 + "b\n" * 10).splitlines(True))
+OTHER20 = tuple(("a\n" * 10 + "c\n" + "b\n" * 8 + "c\n").splitlines(True))
+
+# Inputs in which every line is "popular" for difflib's autojunk heuristic
+POPULAR_BASE = tuple(c + "\n" for c in str(7**400)[:300])
+POPULAR_THIS = POPULAR_BASE[:10] + ("b\n",) + POPULAR_BASE[11:]
+POPULAR_OTHER = POPULAR_BASE[:250] + ("c\n",) + POPULAR_BASE[251:]
+
+# Cherrypick inputs with both removed and added lines
+MIXED_BASE = ["a\n", "b\n", "c\n", "d\n", "e\n"]
+MIXED_THIS = ["a\n", "b\n", "q\n"]
+MIXED_OTHER = ["a\n", "b\n", "c\n", "d\n", "f\n", "e\n", "g\n"]
+
+# Non-str inputs for test_allow_objects
+PAIRS_ABCDE = [(int2byte(x), int2byte(x)) for x in b"abcde"]
+PAIRS_ABCDEF = [(int2byte(x), int2byte(x)) for x in b"abcdef"]
+PAIRS_ZABCDE = [(int2byte(x), int2byte(x)) for x in b"Zabcde"]
+
+
+class RecordingSequenceMatcher(difflib.SequenceMatcher):
+    """difflib.SequenceMatcher that records the sequences it diffs."""
+
+    calls = []
+
+    def get_matching_blocks(self):
+        self.calls.append((self.a, self.b))
+        return super().get_matching_blocks()
 
 
 class TestMerge3(unittest.TestCase):
@@ -114,6 +152,43 @@ class TestMerge3(unittest.TestCase):
 
         self.assertEqual(list(m3.merge_groups()), [("unchanged", ["aaa", "bbb"])])
 
+    def test_one_side_unchanged(self):
+        """One side identical to base, with the other side changed."""
+        base = ["aaa\n", "bbb\n", "ccc\n"]
+        m3 = merge3.Merge3(base, list(base), ["aaa\n", "222\n", "ccc\n"])
+
+        self.assertEqual(
+            list(m3.find_sync_regions()),
+            [(0, 1, 0, 1, 0, 1), (2, 3, 2, 3, 2, 3), (3, 3, 3, 3, 3, 3)],
+        )
+
+        self.assertEqual("".join(m3.merge_lines()), "aaa\n222\nccc\n")
+
+    def test_cached_results(self):
+        """Results are computed once, and callers get their own copies."""
+        del RecordingSequenceMatcher.calls[:]
+        m3 = merge3.Merge3(
+            ["aaa\n", "bbb\n"],
+            ["aaa\n", "111\n", "bbb\n"],
+            ["aaa\n", "bbb\n"],
+            sequence_matcher=RecordingSequenceMatcher,
+        )
+        sync_regions = m3.find_sync_regions()
+        unconflicted = m3.find_unconflicted()
+        sync_regions.clear()
+        unconflicted.clear()
+        self.assertEqual(
+            m3.find_sync_regions(),
+            [(0, 1, 0, 1, 0, 1), (1, 2, 2, 3, 1, 2), (2, 2, 3, 3, 2, 2)],
+        )
+        self.assertEqual(m3.find_unconflicted(), [(0, 1), (1, 2)])
+        self.assertEqual(list(m3.merge_lines()), ["aaa\n", "111\n", "bbb\n"])
+        self.assertEqual(list(m3.merge_lines()), ["aaa\n", "111\n", "bbb\n"])
+        list(m3.merge_groups())
+        list(m3.merge_annotated())
+        # b is the same as base, so only base and a are diffed, once
+        self.assertEqual(1, len(RecordingSequenceMatcher.calls))
+
     def test_front_insert(self):
         m3 = merge3.Merge3([b"zz"], [b"aaa", b"bbb", b"zz"], [b"zz"])
 
@@ -206,6 +281,29 @@ bbb
 --
 333
 >> b
+""",
+        )
+
+    def test_replace_clash_with_base(self):
+        m3 = merge3.Merge3(
+            ["aaa\n", "000\n", "bbb\n"],
+            ["aaa\n", "111\n", "bbb\n"],
+            ["aaa\n", "222\n", "bbb\n"],
+        )
+
+        ml = m3.merge_lines(name_a="a", name_b="b", name_base="base", base_marker="||")
+        self.assertEqual(
+            "".join(ml),
+            """\
+aaa
+<<<<<<< a
+111
+|| base
+000
+=======
+222
+>>>>>>> b
+bbb
 """,
         )
 
@@ -310,19 +408,15 @@ bbb
 
     def test_merge_poem_bytes(self):
         """Test case from diff3 manual."""
-        m3 = merge3.Merge3(
-            [line.encode() for line in TZU],
-            [line.encode() for line in LAO],
-            [line.encode() for line in TAO],
-        )
+        m3 = merge3.Merge3(TZU_B, LAO_B, TAO_B)
         ml = list(m3.merge_lines(b"LAO", b"TAO"))
-        self.assertEqual(ml, [line.encode() for line in MERGED_RESULT])
+        self.assertEqual(ml, MERGED_RESULT_B)
 
     def test_minimal_conflicts_common(self):
         """Reprocessing."""
-        base_text = ("a\n" * 20).splitlines(True)
-        this_text = ("a\n" * 10 + "b\n" * 10).splitlines(True)
-        other_text = ("a\n" * 10 + "c\n" + "b\n" * 8 + "c\n").splitlines(True)
+        base_text = BASE20
+        this_text = THIS20
+        other_text = OTHER20
         m3 = merge3.Merge3(base_text, other_text, this_text)
         m_lines = m3.merge_lines("OTHER", "THIS", reprocess=True)
         merged_text = "".join(list(m_lines))
@@ -338,17 +432,82 @@ bbb
         )
         self.assertEqual(optimal_text, merged_text)
 
-    def test_cherrypick(self):
-        base_text = "ba\nb\n"
-        this_text = "ba\n"
-        other_text = "a\nb\nc\n"
+    def test_popular_lines(self):
+        """Frequent lines in large inputs are not treated as junk."""
+        m3 = merge3.Merge3(POPULAR_BASE, POPULAR_THIS, POPULAR_OTHER)
+        self.assertEqual(
+            [t for t in m3.merge_regions() if t[0] != "unchanged"],
+            [("a", 10, 11), ("b", 250, 251)],
+        )
 
+        m3 = merge3.Merge3(POPULAR_BASE, POPULAR_THIS, POPULAR_OTHER, autojunk=True)
+        self.assertEqual(
+            [t for t in m3.merge_regions() if t[0] != "unchanged"],
+            [("conflict", 10, 300, 10, 300, 10, 300)],
+        )
+
+    def test_custom_matcher_autojunk(self):
+        """The autojunk setting is passed on to matchers that accept it."""
         m3 = merge3.Merge3(
-            base_text.splitlines(True),
-            other_text.splitlines(True),
-            this_text.splitlines(True),
+            POPULAR_BASE,
+            POPULAR_THIS,
+            POPULAR_OTHER,
+            sequence_matcher=RecordingSequenceMatcher,
+        )
+        self.assertEqual(
+            [t for t in m3.merge_regions() if t[0] != "unchanged"],
+            [("a", 10, 11), ("b", 250, 251)],
+        )
+
+        self.assertIs(RecordingSequenceMatcher, m3.sequence_matcher)
+
+        def matcher(isjunk, a, b):
+            return difflib.SequenceMatcher(isjunk, a, b)
+
+        m3 = merge3.Merge3(
+            POPULAR_BASE, POPULAR_THIS, POPULAR_OTHER, sequence_matcher=matcher
+        )
+        self.assertEqual(
+            [t for t in m3.merge_regions() if t[0] != "unchanged"],
+            [("conflict", 10, 300, 10, 300, 10, 300)],
+        )
+
+        # An autojunk setting bound by the caller is left alone.
+        m3 = merge3.Merge3(
+            POPULAR_BASE,
+            POPULAR_THIS,
+            POPULAR_OTHER,
+            sequence_matcher=functools.partial(difflib.SequenceMatcher, autojunk=True),
+        )
+        self.assertEqual(
+            [t for t in m3.merge_regions() if t[0] != "unchanged"],
+            [("conflict", 10, 300, 10, 300, 10, 300)],
+        )
+
+    def test_custom_matcher_kwargs(self):
+        """Matchers that forward **kwargs are not given autojunk."""
+
+        def diff(isjunk, a, b):
+            return difflib.SequenceMatcher(isjunk, a, b)
+
+        def matcher(*args: object, **kwargs: object):
+            return diff(*args, **kwargs)
+
+        m3 = merge3.Merge3(
+            POPULAR_BASE, POPULAR_THIS, POPULAR_OTHER, sequence_matcher=matcher
+        )
+        self.assertEqual(
+            [t for t in m3.merge_regions() if t[0] != "unchanged"],
+            [("conflict", 10, 300, 10, 300, 10, 300)],
         )
 
+    def test_cherrypick(self):
+        base_text = ["ba\n", "b\n"]
+        this_text = ["ba\n"]
+        other_text = ["a\n", "b\n", "c\n"]
+
+        m3 = merge3.Merge3(base_text, other_text, this_text)
+
         self.assertEqual(m3.find_unconflicted(), [])
 
         self.assertEqual(list(m3.find_sync_regions()), [(2, 2, 3, 3, 1, 1)])
@@ -359,9 +518,9 @@ bbb
             import patiencediff
         except ImportError:
             self.skipTest("patiencediff not available")
-        base_text = ("a\n" * 20).splitlines(True)
-        this_text = ("a\n" * 10 + "b\n" * 10).splitlines(True)
-        other_text = ("a\n" * 10 + "c\n" + "b\n" * 8 + "c\n").splitlines(True)
+        base_text = BASE20
+        this_text = THIS20
+        other_text = OTHER20
         m3 = merge3.Merge3(
             base_text,
             other_text,
@@ -380,6 +539,29 @@ bbb
         )
         self.assertEqual(optimal_text, merged_text)
 
+    def test_merge_poem_with_rapidfuzz(self):
+        try:
+            import rapidfuzz  # noqa: F401
+        except ImportError:
+            self.skipTest("rapidfuzz not available")
+        m3 = merge3.Merge3(
+            TZU, LAO, TAO, sequence_matcher=merge3.RapidFuzzSequenceMatcher
+        )
+        ml = list(m3.merge_lines("LAO", "TAO"))
+        self.assertEqual(ml, MERGED_RESULT)
+
+    def test_set_default_sequence_matcher(self):
+        merge3.set_default_sequence_matcher(RecordingSequenceMatcher)
+        self.addCleanup(merge3.set_default_sequence_matcher, None)
+        m3 = merge3.Merge3(TZU, LAO, TAO)
+        self.assertIs(RecordingSequenceMatcher, m3.sequence_matcher)
+        self.assertEqual(MERGED_RESULT, list(m3.merge_lines("LAO", "TAO")))
+
+        merge3.set_default_sequence_matcher(None)
+        m3 = merge3.Merge3(TZU, LAO, TAO)
+        self.assertIsNot(RecordingSequenceMatcher, m3.sequence_matcher)
+        self.assertEqual(MERGED_RESULT, list(m3.merge_lines("LAO", "TAO")))
+
     def test_minimal_conflicts_unique(self):
         def add_newline(s):
             """Add a newline to each entry in the string."""
@@ -418,24 +600,33 @@ bbb
         )
         self.assertEqual(optimal_text, merged_text)
 
+    def test_reprocess_delete_clash(self):
+        """A conflict where one side deleted the lines is left as is."""
+        m3 = merge3.Merge3(
+            ["aaa\n", "bbb\n", "ccc\n"],
+            ["aaa\n", "ccc\n"],
+            ["aaa\n", "222\n", "ccc\n"],
+        )
+        self.assertEqual(
+            list(m3.reprocess_merge_regions(m3.merge_regions())),
+            [
+                ("unchanged", 0, 1),
+                ("conflict", None, None, 1, 1, 1, 2),
+                ("unchanged", 2, 3),
+            ],
+        )
+
     def test_reprocess_and_base(self):
         """Reprocessing and showing base breaks correctly."""
-        base_text = ("a\n" * 20).splitlines(True)
-        this_text = ("a\n" * 10 + "b\n" * 10).splitlines(True)
-        other_text = ("a\n" * 10 + "c\n" + "b\n" * 8 + "c\n").splitlines(True)
+        base_text = BASE20
+        this_text = THIS20
+        other_text = OTHER20
         m3 = merge3.Merge3(base_text, other_text, this_text)
         m_lines = m3.merge_lines("OTHER", "THIS", reprocess=True, base_marker="|||||||")
         self.assertRaises(merge3.CantReprocessAndShowBase, list, m_lines)
 
     def test_dos_text(self):
-        base_text = "a\r\n"
-        this_text = "b\r\n"
-        other_text = "c\r\n"
-        m3 = merge3.Merge3(
-            base_text.splitlines(True),
-            other_text.splitlines(True),
-            this_text.splitlines(True),
-        )
+        m3 = merge3.Merge3(["a\r\n"], ["c\r\n"], ["b\r\n"])
         m_lines = m3.merge_lines("OTHER", "THIS")
         self.assertEqual(
             "<<<<<<< OTHER\r\nc\r\n=======\r\nb\r\n>>>>>>> THIS\r\n".splitlines(True),
@@ -443,55 +634,56 @@ bbb
         )
 
     def test_mac_text(self):
-        base_text = "a\r"
-        this_text = "b\r"
-        other_text = "c\r"
-        m3 = merge3.Merge3(
-            base_text.splitlines(True),
-            other_text.splitlines(True),
-            this_text.splitlines(True),
-        )
+        m3 = merge3.Merge3(["a\r"], ["c\r"], ["b\r"])
         m_lines = m3.merge_lines("OTHER", "THIS")
         self.assertEqual(
             "<<<<<<< OTHER\rc\r=======\rb\r>>>>>>> THIS\r".splitlines(True),
             list(m_lines),
         )
 
+    def test_dos_bytes(self):
+        m3 = merge3.Merge3([b"a\r\n"], [b"c\r\n"], [b"b\r\n"])
+        self.assertEqual(
+            b"<<<<<<<\r\nc\r\n=======\r\nb\r\n>>>>>>>\r\n".splitlines(True),
+            list(m3.merge_lines()),
+        )
+
     def test_merge3_cherrypick(self):
-        base_text = "a\nb\n"
-        this_text = "a\n"
-        other_text = "a\nb\nc\n"
+        base_text = ["a\n", "b\n"]
+        this_text = ["a\n"]
+        other_text = ["a\n", "b\n", "c\n"]
         # When cherrypicking, lines in base are not part of the conflict
-        m3 = merge3.Merge3(
-            base_text.splitlines(True),
-            this_text.splitlines(True),
-            other_text.splitlines(True),
-            is_cherrypick=True,
-        )
+        m3 = merge3.Merge3(base_text, this_text, other_text, is_cherrypick=True)
         m_lines = m3.merge_lines()
         self.assertEqual("a\n<<<<<<<\n=======\nc\n>>>>>>>\n", "".join(m_lines))
 
         # This is not symmetric
-        m3 = merge3.Merge3(
-            base_text.splitlines(True),
-            other_text.splitlines(True),
-            this_text.splitlines(True),
-            is_cherrypick=True,
-        )
+        m3 = merge3.Merge3(base_text, other_text, this_text, is_cherrypick=True)
         m_lines = m3.merge_lines()
         self.assertEqual("a\n<<<<<<<\nb\nc\n=======\n>>>>>>>\n", "".join(m_lines))
 
-    def test_merge3_cherrypick_w_mixed(self):
-        base_text = "a\nb\nc\nd\ne\n"
-        this_text = "a\nb\nq\n"
-        other_text = "a\nb\nc\nd\nf\ne\ng\n"
-        # When cherrypicking, lines in base are not part of the conflict
+    def test_merge3_cherrypick_no_sentinel(self):
+        """Cherrypicking copes with matchers that omit the final sentinel."""
+
+        class Matcher(difflib.SequenceMatcher):
+            def get_matching_blocks(self):
+                return super().get_matching_blocks()[:-1]
+
         m3 = merge3.Merge3(
-            base_text.splitlines(True),
-            this_text.splitlines(True),
-            other_text.splitlines(True),
+            MIXED_BASE,
+            MIXED_THIS,
+            MIXED_OTHER,
             is_cherrypick=True,
+            sequence_matcher=Matcher,
         )
+        self.assertEqual(
+            "a\nb\n<<<<<<<\nq\n=======\nf\n>>>>>>>\n<<<<<<<\n=======\ng\n>>>>>>>\n",
+            "".join(m3.merge_lines()),
+        )
+
+    def test_merge3_cherrypick_w_mixed(self):
+        # When cherrypicking, lines in base are not part of the conflict
+        m3 = merge3.Merge3(MIXED_BASE, MIXED_THIS, MIXED_OTHER, is_cherrypick=True)
         m_lines = m3.merge_lines()
         self.assertEqual(
             "a\nb\n<<<<<<<\nq\n=======\nf\n>>>>>>>\n<<<<<<<\n=======\ng\n>>>>>>>\n",
@@ -504,21 +696,71 @@ bbb
         merge_groups and merge_regions work with non-str input.  Methods that
         return lines like merge_lines fail.
         """
-        base = [(int2byte(x), int2byte(x)) for x in bytearray(b"abcde")]
-        a = [(int2byte(x), int2byte(x)) for x in bytearray(b"abcdef")]
-        b = [(int2byte(x), int2byte(x)) for x in bytearray(b"Zabcde")]
-        m3 = merge3.Merge3(base, a, b)
+        m3 = merge3.Merge3(PAIRS_ABCDE, PAIRS_ABCDEF, PAIRS_ZABCDE)
         self.assertEqual(
             [("b", 0, 1), ("unchanged", 0, 5), ("a", 5, 6)], list(m3.merge_regions())
         )
         self.assertEqual(
             [
                 ("b", [(b"Z", b"Z")]),
-                (
-                    "unchanged",
-                    [(int2byte(x), int2byte(x)) for x in bytearray(b"abcde")],
-                ),
+                ("unchanged", PAIRS_ABCDE),
                 ("a", [(b"f", b"f")]),
             ],
             list(m3.merge_groups()),
         )
+
+    def test_compare_range(self):
+        self.assertTrue(merge3.compare_range(["a", "b"], 0, 2, ["x", "a", "b"], 1, 3))
+        self.assertFalse(merge3.compare_range(["a", "b"], 0, 2, ["a", "c"], 0, 2))
+        self.assertFalse(merge3.compare_range(["a", "b"], 0, 2, ["a"], 0, 1))
+        # Mixed sequence types are compared element by element.
+        self.assertTrue(merge3.compare_range(["a", "b"], 0, 2, ("a", "b"), 0, 2))
+
+    def test_compare_range_no_slicing(self):
+        """Sequences that do not support slicing can be compared."""
+
+        class Lines:
+            def __init__(self, lines) -> None:
+                self._lines = lines
+
+            def __len__(self) -> int:
+                return len(self._lines)
+
+            def __getitem__(self, i) -> str:
+                if isinstance(i, slice):
+                    raise TypeError("slicing not supported")
+                return self._lines[i]
+
+        a = Lines(["a", "b", "c"])
+        b = Lines(["x", "b", "c"])
+        self.assertTrue(merge3.compare_range(a, 1, 3, b, 1, 3))
+        self.assertFalse(merge3.compare_range(a, 0, 2, b, 0, 2))
+
+    def test_merge_annotated(self):
+        m3 = merge3.Merge3(
+            ["common\n", "base\n"], ["common\n", "a\n"], ["common\n", "b\n"]
+        )
+        self.assertEqual(
+            list(m3.merge_annotated()),
+            ["u | common\n", "<<<<\n", "A | a\n", "----\n", "B | b\n", ">>>>\n"],
+        )
+
+    def test_merge_regions_list(self):
+        m3 = merge3.Merge3(["aaa", "bbb"], ["aaa", "111", "bbb"], ["aaa", "bbb"])
+        regions = m3.merge_regions_list()
+        self.assertEqual(
+            regions, [("unchanged", 0, 1), ("a", 1, 2), ("unchanged", 1, 2)]
+        )
+        # The returned list is a copy.
+        regions.clear()
+        self.assertEqual(list(m3.merge_regions()), m3.merge_regions_list())
+        self.assertEqual(len(m3.merge_regions_list()), 3)
+
+    def test_merge_annotated_bytes(self):
+        m3 = merge3.Merge3(
+            [b"common\n", b"base\n"], [b"common\n", b"a\n"], [b"common\n", b"b\n"]
+        )
+        self.assertEqual(
+            list(m3.merge_annotated()),
+            [b"u | common\n", b"<<<<\n", b"A | a\n", b"----\n", b"B | b\n", b">>>>\n"],
+        )